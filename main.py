@@ -1,60 +1,16 @@
-import ollama
 import sys
 import os
-import json
-import numpy as np
+import time
+import asyncio
+import ollama
+from io import StringIO
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Tuple, TextIO
 
-def get_embeddings(text: str) -> List[float]:
-    """Get embeddings using nomic-embed-text"""
-    response = ollama.embeddings(
-        model='nomic-embed-text',
-        prompt=text
-    )
-    return response['embedding']
-
-def cosine_similarity(a: List[float], b: List[float]) -> float:
-    """Calculate cosine similarity between two vectors"""
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-def chunk_document(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[str]:
-    """Split document into overlapping chunks"""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start = end - overlap
-    return chunks
-
-def find_relevant_context(query: str, document_chunks: Dict[str, List[str]], embeddings_cache: Dict[str, List[float]], top_k: int = 3) -> str:
-    """Find most relevant document chunks using semantic search"""
-    query_embedding = get_embeddings(query)
-    
-    # Calculate similarities
-    chunk_scores = []
-    for doc_name, chunks in document_chunks.items():
-        for i, chunk in enumerate(chunks):
-            cache_key = f"{doc_name}_{i}"
-            if cache_key not in embeddings_cache:
-                embeddings_cache[cache_key] = get_embeddings(chunk)
-            
-            similarity = cosine_similarity(query_embedding, embeddings_cache[cache_key])
-            chunk_scores.append((similarity, doc_name, chunk))
-    
-    # Get top k most relevant chunks
-    chunk_scores.sort(reverse=True)
-    relevant_chunks = chunk_scores[:top_k]
-    
-    # Format context
-    context = ""
-    for _, doc_name, chunk in relevant_chunks:
-        context += f"\n{doc_name}:\n{chunk}\n"
-    
-    return context
+from rag_core import OLLAMA_HOST, OLLAMA_LIMITS, load_embeddings_cache, embed_documents, build_index, find_relevant_context
+
+STREAM_FLUSH_INTERVAL = 0.05
 
 def get_user_input() -> Tuple[List[str], str, List[str]]:
     """Get user input about the document analysis task"""
@@ -88,8 +44,11 @@ def get_user_input() -> Tuple[List[str], str, List[str]]:
     
     return entities, objective, documents
 
-def analyze_documents_stream(query: str, context: str, entities: list, objective: str) -> str:
-    """Analyze documents using Ollama qwq model with streaming"""
+async def analyze_documents_stream(client: ollama.AsyncClient, query: str, context: str, entities: list, objective: str, response: StringIO, live: asyncio.Event) -> str:
+    """Analyze documents using Ollama qwq model with streaming
+
+    Tokens are collected in response; once live is set they are also echoed to stdout.
+    """
     entities_str = ", ".join(entities)
     prompt = f"""You are an AI assistant analyzing documents involving these entities: {entities_str}.
 Core objective: {objective}
@@ -113,40 +72,66 @@ Format your response in clear sections:
 - Proposed Changes
 - Recommendations"""
 
-    stream = ollama.chat(
+    stream = await client.chat(
         model='qwq',
         messages=[{'role': 'user', 'content': prompt}],
         stream=True
     )
 
-    response_parts = []
-    for chunk in stream:
+    # Flush stdout every few ms instead of once per streamed token
+    last_flush = time.monotonic()
+    async for chunk in stream:
         content = chunk['message']['content']
-        response_parts.append(content)
-        print(content, end='', flush=True)
-    print()  # New line after response
-    
-    return "".join(response_parts)
-
-def read_file_content(filename: str) -> str:
-    """Read content from a file"""
-    with open(filename, 'r') as f:
-        return f.read()
-
-def save_analysis(query: str, response: str, timestamp: str) -> Path:
-    """Save analysis to markdown file"""
-    out_dir = Path("out")
-    out_dir.mkdir(exist_ok=True)
-    
-    filename = f"analysis_{timestamp}.md"
-    filepath = out_dir / filename
-    
-    with open(filepath, "a") as f:
-        f.write(f"\n## Query: {query}\n\n")
-        f.write(response)
-        f.write("\n\n---\n")
-    
-    return filepath
+        response.write(content)
+        if live.is_set():
+            sys.stdout.write(content)
+            if time.monotonic() - last_flush > STREAM_FLUSH_INTERVAL:
+                sys.stdout.flush()
+                last_flush = time.monotonic()
+    
+    return response.getvalue()
+
+async def analyze_queries(queries: List[str], contexts: List[str], entities: list, objective: str, f: TextIO) -> None:
+    """Run all queries concurrently, saving each response in query order
+
+    The earliest unfinished query streams to the terminal live; later ones
+    buffer until it is their turn, then print what they have so far and continue live.
+    """
+    client = ollama.AsyncClient(host=OLLAMA_HOST, limits=OLLAMA_LIMITS)
+    tasks = []
+    try:
+        buffers = [StringIO() for _ in queries]
+        live = [asyncio.Event() for _ in queries]
+        tasks = [
+            asyncio.create_task(analyze_documents_stream(client, query, context, entities, objective, buffers[i], live[i]))
+            for i, (query, context) in enumerate(zip(queries, contexts))
+        ]
+        
+        for i, (query, task) in enumerate(zip(queries, tasks)):
+            print(f"\nQuery: {query}")
+            print("-" * 80)
+            print("\nAnalysis & Response:")
+            sys.stdout.write(buffers[i].getvalue())
+            live[i].set()
+            
+            response = await task
+            print()  # New line after response
+            
+            # Save to file
+            save_analysis(query, response, f)
+            
+            print("\n" + "=" * 80)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # The pinned ollama client has no close method of its own
+        await client._client.aclose()
+
+def save_analysis(query: str, response: str, f: TextIO) -> None:
+    """Write one query's analysis to the open markdown report"""
+    f.write(f"\n## Query: {query}\n\n")
+    f.write(response)
+    f.write("\n\n---\n")
 
 def main():
     # Get user input
@@ -156,17 +141,13 @@ def main():
         print("Error: No valid documents provided.")
         return
     
-    # Load and chunk documents
-    docs = {}
-    document_chunks = {}
-    for doc in documents:
-        name = os.path.splitext(doc)[0].upper()
-        content = read_file_content(f"doc/{doc}")
-        docs[name] = content
-        document_chunks[name] = chunk_document(content)
-    
-    # Initialize embeddings cache
-    embeddings_cache = {}
+    # Stream, chunk and embed all documents once before querying,
+    # reusing embeddings from earlier runs
+    doc_paths = {os.path.splitext(doc)[0].upper(): f"doc/{doc}" for doc in documents}
+    embeddings_cache = load_embeddings_cache()
+    chunk_embeddings, chunk_meta = embed_documents(doc_paths, embeddings_cache)
+    index = build_index(chunk_embeddings)
+    del chunk_embeddings
     
     # Generate default queries based on objective
     default_queries = [
@@ -190,21 +171,16 @@ def main():
     print("=" * 80)
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out_dir = Path("out")
+    out_dir.mkdir(exist_ok=True)
+    filepath = out_dir / f"analysis_{timestamp}.md"
     
-    for query in default_queries:
-        print(f"\nQuery: {query}")
-        print("-" * 80)
-        
-        # Find relevant context using semantic search
-        context = find_relevant_context(query, document_chunks, embeddings_cache)
-        
-        print("\nAnalysis & Response:")
-        response = analyze_documents_stream(query, context, entities, objective)
-        
-        # Save to file
-        filepath = save_analysis(query, response, timestamp)
-        
-        print("\n" + "=" * 80)
+    # Find relevant context for every query using semantic search
+    contexts = [find_relevant_context(query, doc_paths, index, chunk_meta) for query in default_queries]
+    
+    # Keep the report open across queries instead of reopening it each time
+    with open(filepath, "w", buffering=1 << 16) as f:
+        asyncio.run(analyze_queries(default_queries, contexts, entities, objective, f))
     
     print(f"\nAnalysis saved to: {filepath}")
 
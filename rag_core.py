@@ -0,0 +1,373 @@
+import ollama
+import httpx
+import tiktoken
+import os
+import json
+import hashlib
+import functools
+import time
+import uuid
+import numpy as np
+import faiss
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import List, Dict, Tuple, Iterator, Optional
+
+OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+EMBED_MODEL = 'nomic-embed-text'
+EMBED_WORKERS = 8
+EMBED_BATCH_SIZE = 64
+CACHE_DIR = Path("cache")
+CACHE_MAX_ENTRIES = 20_000
+HNSW_MIN_CHUNKS = 50_000
+CHUNK_SEPARATORS = [b"\n", b". ", b" "]
+
+# One keep-alive connection pool per client, reused for every embed and chat call
+OLLAMA_LIMITS = httpx.Limits(max_keepalive_connections=40, keepalive_expiry=30.0)
+
+client = ollama.Client(host=OLLAMA_HOST, limits=OLLAMA_LIMITS)
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    """Scale vectors (or matrix rows) to unit L2 norm"""
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+def _embed_text(text: str) -> List[float]:
+    """Raw single-text embedding request to nomic-embed-text"""
+    response = client.embeddings(
+        model=EMBED_MODEL,
+        prompt=text
+    )
+    return response['embedding']
+
+@functools.lru_cache(maxsize=1024)
+def get_embeddings(text: str) -> np.ndarray:
+    """Get embeddings using nomic-embed-text
+
+    The returned vector is already L2-normalized, so cosine similarity
+    against other normalized embeddings is a plain dot product.
+    Do not normalize it again. Results are memoized per text and returned
+    read-only, since the same array is shared between callers.
+    """
+    embedding = _normalize(np.asarray(_embed_text(text), dtype=np.float32))
+    embedding.setflags(write=False)
+    return embedding
+
+def get_embeddings_batch(texts: List[str], parallel: bool = True) -> np.ndarray:
+    """Get embeddings for many texts in one request via /api/embed
+
+    Returns an (N, D) matrix whose rows are L2-normalized, same as get_embeddings.
+    Pass parallel=False when already running inside a worker pool, so the
+    single-text fallback doesn't multiply the number of concurrent requests.
+    """
+    # The pinned ollama client has no wrapper for the /api/embed batch endpoint,
+    # so post through its underlying httpx client to share the keep-alive pool
+    response = client._client.post(
+        "/api/embed",
+        json={'model': EMBED_MODEL, 'input': texts}
+    )
+    data = response.json() if response.is_success else {}
+    if 'embeddings' in data:
+        embeddings = data['embeddings']
+    else:
+        # Older Ollama servers lack the batch endpoint, so fall back to single requests
+        if parallel:
+            with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+                embeddings = list(executor.map(_embed_text, texts))
+        else:
+            embeddings = [_embed_text(text) for text in texts]
+    return _normalize(np.array(embeddings, dtype=np.float32))
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding() -> Optional[tiktoken.Encoding]:
+    """Load the tokenizer used for chunk sizing, or None if it is unavailable
+
+    cl100k_base approximates the embedding model's tokenizer. tiktoken downloads
+    it once on first use and caches it; without network access we fall back to
+    a character-based estimate instead of failing.
+    """
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Warning: could not load tiktoken encoding ({type(e).__name__}), estimating tokens from length")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text"""
+    encoding = _get_encoding()
+    if encoding is None:
+        # Roughly four characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def _iter_paragraphs(f) -> Iterator[Tuple[int, bytes]]:
+    """Stream blank-line separated paragraphs from a binary file as (offset, data)"""
+    offset = 0
+    paragraph = bytearray()
+    for line in f:
+        paragraph += line
+        if not line.strip():
+            yield offset, bytes(paragraph)
+            offset += len(paragraph)
+            paragraph = bytearray()
+    if paragraph:
+        yield offset, bytes(paragraph)
+
+def _split_piece(offset: int, data: bytes, max_tokens: int, separators: List[bytes]) -> Iterator[Tuple[int, bytes, int]]:
+    """Recursively split data on separators until each piece fits, yielding (offset, data, tokens)"""
+    tokens = count_tokens(data.decode('utf-8', errors='ignore'))
+    if tokens <= max_tokens or not separators:
+        yield offset, data, tokens
+        return
+    
+    separator, remaining = separators[0], separators[1:]
+    parts = data.split(separator)
+    for i, part in enumerate(parts):
+        # Keep the separator attached so pieces stay contiguous in the file
+        if i < len(parts) - 1:
+            part += separator
+        if part:
+            yield from _split_piece(offset, part, max_tokens, remaining)
+        offset += len(part)
+
+def _join_pieces(pieces: List[Tuple[int, bytes, int]]) -> Tuple[int, int, str]:
+    """Join contiguous pieces into a single (offset, length, text) chunk"""
+    data = b"".join(piece for _, piece, _ in pieces)
+    return pieces[0][0], len(data), data.decode('utf-8', errors='ignore')
+
+def _overlap_tail(pieces: List[Tuple[int, bytes, int]], overlap_tokens: int) -> List[Tuple[int, bytes, int]]:
+    """Take the end of a chunk, up to overlap_tokens, splitting the last pieces finer as needed"""
+    tail = []
+    tail_tokens = 0
+    for offset, data, tokens in reversed(pieces):
+        budget = overlap_tokens - tail_tokens
+        if budget <= 0:
+            break
+        if tokens <= budget:
+            tail.insert(0, (offset, data, tokens))
+            tail_tokens += tokens
+            continue
+        
+        # The piece is too long to carry whole: keep as many of its trailing
+        # lines, sentences or words as fit, then stop so the tail stays contiguous
+        parts = list(_split_piece(offset, data, budget, CHUNK_SEPARATORS))
+        for part in reversed(parts):
+            if tail_tokens + part[2] > overlap_tokens:
+                break
+            tail.insert(0, part)
+            tail_tokens += part[2]
+        break
+    return tail
+
+def iter_chunks(path: str, chunk_tokens: int = 500, overlap_tokens: int = 50) -> Iterator[Tuple[int, int, str]]:
+    """Stream a file in overlapping, token-sized chunks, yielding (offset, length, text) with byte offsets
+
+    Paragraphs are merged until the token budget is reached; oversized ones are
+    split on lines, then sentences, then words.
+    """
+    window: List[Tuple[int, bytes, int]] = []
+    window_tokens = 0
+    with open(path, 'rb') as f:
+        for paragraph_offset, paragraph in _iter_paragraphs(f):
+            for offset, piece, tokens in _split_piece(paragraph_offset, paragraph, chunk_tokens, CHUNK_SEPARATORS):
+                if window and window_tokens + tokens > chunk_tokens:
+                    yield _join_pieces(window)
+                    # Carry the end of this chunk into the next one as overlap
+                    window = _overlap_tail(window, min(overlap_tokens, chunk_tokens - tokens))
+                    window_tokens = sum(part_tokens for _, _, part_tokens in window)
+                window.append((offset, piece, tokens))
+                window_tokens += tokens
+    
+    if window:
+        yield _join_pieces(window)
+
+def read_chunk(path: str, offset: int, length: int) -> str:
+    """Read a single chunk back from a file by its byte offset"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length).decode('utf-8', errors='ignore')
+
+def chunk_hash(text: str) -> str:
+    """Content hash used as the embeddings cache key"""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+class EmbeddingsCache:
+    """On-disk chunk embeddings keyed by content hash, bounded by least-recent use
+
+    The matrix lives in its own file and is memory-mapped on load, so only rows
+    that are used get paged in. An index file lists the keys, their last-used
+    times and which matrix file they belong to; replacing it is the single
+    atomic step that commits a save, so a crash never pairs keys with the
+    wrong matrix.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.embeddings: Dict[str, np.ndarray] = {}
+        self.last_used: Dict[str, float] = {}
+        self.matrix_name: Optional[str] = None
+        self.changed = False
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.embeddings
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def get(self, key: str) -> np.ndarray:
+        """Return a cached embedding and mark it as used now"""
+        self.last_used[key] = time.time()
+        return self.embeddings[key]
+
+    def add(self, key: str, embedding: np.ndarray) -> None:
+        """Add a new embedding"""
+        self.embeddings[key] = embedding
+        self.last_used[key] = time.time()
+        self.changed = True
+
+    def evict(self) -> None:
+        """Drop the least recently used entries beyond max_entries"""
+        excess = len(self.embeddings) - self.max_entries
+        if excess <= 0:
+            return
+        for key in sorted(self.last_used, key=self.last_used.get)[:excess]:
+            del self.embeddings[key]
+            del self.last_used[key]
+        self.changed = True
+
+def _cache_index_path() -> Path:
+    """Index file of the embeddings cache for the current model"""
+    # Separate caches per model, so switching models never reuses stale vectors
+    return CACHE_DIR / f"embeddings-{EMBED_MODEL.replace('/', '_').replace(':', '_')}.json"
+
+def load_embeddings_cache() -> EmbeddingsCache:
+    """Load the on-disk embeddings cache, or an empty one if it is missing or inconsistent"""
+    cache = EmbeddingsCache()
+    index_path = _cache_index_path()
+    if not index_path.exists():
+        return cache
+    
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        keys, last_used = index["keys"], index["last_used"]
+        matrix = np.load(CACHE_DIR / index["matrix"], mmap_mode="r")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: ignoring unreadable embeddings cache ({type(e).__name__})")
+        return cache
+    if not (len(keys) == len(last_used) == matrix.shape[0]):
+        print("Warning: ignoring embeddings cache whose keys and matrix do not match")
+        return cache
+    
+    cache.embeddings = {key: matrix[i] for i, key in enumerate(keys)}
+    cache.last_used = dict(zip(keys, last_used))
+    cache.matrix_name = index["matrix"]
+    return cache
+
+def save_embeddings_cache(cache: EmbeddingsCache) -> None:
+    """Write the embeddings cache to disk, rewriting the matrix only when entries changed"""
+    CACHE_DIR.mkdir(exist_ok=True)
+    cache.evict()
+    index_path = _cache_index_path()
+    old_matrix_name = cache.matrix_name
+    
+    if cache.changed or old_matrix_name is None:
+        # A fresh matrix file per generation; the old one may still be mapped
+        matrix_name = f"{index_path.stem}-{uuid.uuid4().hex[:12]}.npy"
+        matrix = np.array(list(cache.embeddings.values()), dtype=np.float32)
+        with open(CACHE_DIR / f"{matrix_name}.tmp", "wb") as f:
+            np.save(f, matrix)
+        os.replace(CACHE_DIR / f"{matrix_name}.tmp", CACHE_DIR / matrix_name)
+    else:
+        # Same keys in the same order as the existing matrix; only times changed
+        matrix_name = old_matrix_name
+    
+    keys = list(cache.embeddings)
+    index_tmp = index_path.with_suffix(".json.tmp")
+    with open(index_tmp, "w") as f:
+        json.dump({"matrix": matrix_name, "keys": keys, "last_used": [cache.last_used[key] for key in keys]}, f)
+    os.replace(index_tmp, index_path)
+    
+    if old_matrix_name is not None and old_matrix_name != matrix_name:
+        try:
+            (CACHE_DIR / old_matrix_name).unlink()
+        except OSError:
+            pass
+    cache.matrix_name = matrix_name
+    cache.changed = False
+
+def embed_documents(doc_paths: Dict[str, str], embeddings_cache: EmbeddingsCache) -> Tuple[np.ndarray, List[Tuple[str, int, int]]]:
+    """Embed every chunk up front, returning an (N, D) matrix and (doc_name, offset, length) metadata"""
+    chunk_meta = []
+    cache_keys = []
+    pending: Dict[str, str] = {}
+    batches: List[Tuple[List[str], Future]] = []
+    
+    # Submit embedding batches while the documents are still being read
+    submitted = set()
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+        for doc_name, path in doc_paths.items():
+            for offset, length, chunk in iter_chunks(path):
+                if not chunk.strip():
+                    continue
+                cache_key = chunk_hash(chunk)
+                if cache_key not in embeddings_cache and cache_key not in submitted:
+                    pending[cache_key] = chunk
+                    submitted.add(cache_key)
+                if len(pending) >= EMBED_BATCH_SIZE:
+                    batches.append((list(pending), executor.submit(get_embeddings_batch, list(pending.values()), parallel=False)))
+                    pending = {}
+                chunk_meta.append((doc_name, offset, length))
+                cache_keys.append(cache_key)
+        
+        if pending:
+            batches.append((list(pending), executor.submit(get_embeddings_batch, list(pending.values()), parallel=False)))
+        
+        for keys, future in batches:
+            for cache_key, embedding in zip(keys, future.result()):
+                embeddings_cache.add(cache_key, embedding)
+    
+    embeddings = np.array([embeddings_cache.get(key) for key in cache_keys], dtype=np.float32)
+    if cache_keys:
+        save_embeddings_cache(embeddings_cache)
+    return embeddings, chunk_meta
+
+def build_index(embeddings: np.ndarray) -> Optional[faiss.Index]:
+    """Build an inner-product FAISS index over normalized chunk embeddings
+
+    Returns None when there are no chunks to index.
+    """
+    if len(embeddings) == 0:
+        return None
+    
+    dim = embeddings.shape[1]
+    if len(embeddings) > HNSW_MIN_CHUNKS:
+        # Approximate graph search keeps queries sublinear on large corpora,
+        # and 8-bit codes store vectors in a quarter of the float32 footprint
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, 32, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    else:
+        # Exact search; at this size the float32 matrix is small anyway
+        index = faiss.IndexFlatIP(dim)
+    index.add(embeddings)
+    return index
+
+def find_relevant_context(query: str, doc_paths: Dict[str, str], index: Optional[faiss.Index], chunk_meta: List[Tuple[str, int, int]], top_k: int = 3) -> str:
+    """Find most relevant document chunks using semantic search"""
+    if index is None:
+        return ""
+    
+    query_embedding = get_embeddings(query)
+    
+    # Embeddings are unit-length, so inner product is cosine similarity;
+    # FAISS returns the top k already ordered by score
+    _, top_indices = index.search(query_embedding[None, :], top_k)
+    
+    # Format context
+    context = ""
+    for i in top_indices[0]:
+        if i < 0:
+            continue
+        doc_name, offset, length = chunk_meta[i]
+        context += f"\n{doc_name}:\n{read_chunk(doc_paths[doc_name], offset, length)}\n"
+    
+    return context
@@ -0,0 +1,209 @@
+import pytest
+
+import rag_core
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    """Count whitespace-separated words as tokens so tests run offline"""
+    monkeypatch.setattr(rag_core, "count_tokens", lambda text: len(text.split()))
+
+
+def write_doc(tmp_path, paragraphs):
+    path = tmp_path / "doc.md"
+    path.write_text("\n\n".join(paragraphs) + "\n")
+    return path
+
+
+def test_chunks_cover_file_and_round_trip(tmp_path):
+    paragraphs = [" ".join(f"word{p}_{w}." if w % 15 == 14 else f"word{p}_{w}" for w in range(120)) for p in range(10)]
+    path = write_doc(tmp_path, paragraphs)
+    data = path.read_bytes()
+
+    chunks = list(rag_core.iter_chunks(str(path), chunk_tokens=500, overlap_tokens=50))
+
+    assert chunks[0][0] == 0
+    assert chunks[-1][0] + chunks[-1][1] == len(data)
+    for offset, length, text in chunks:
+        assert data[offset:offset + length].decode() == text
+        assert rag_core.read_chunk(str(path), offset, length) == text
+        assert len(text.split()) <= 500
+
+
+def test_consecutive_chunks_overlap(tmp_path):
+    # Paragraphs longer than the overlap budget must still be carried over in part
+    paragraphs = [" ".join(f"word{p}_{w}." if w % 15 == 14 else f"word{p}_{w}" for w in range(120)) for p in range(10)]
+    path = write_doc(tmp_path, paragraphs)
+
+    chunks = list(rag_core.iter_chunks(str(path), chunk_tokens=500, overlap_tokens=50))
+
+    assert len(chunks) > 1
+    for (prev_offset, prev_length, _), (offset, _, text) in zip(chunks, chunks[1:]):
+        assert offset < prev_offset + prev_length
+        overlap_words = len(text.encode()[:prev_offset + prev_length - offset].split())
+        assert 0 < overlap_words <= 50
+
+
+def test_overlap_falls_back_to_words(tmp_path):
+    # A single run-on paragraph with no line or sentence breaks
+    path = write_doc(tmp_path, [" ".join(f"w{i}" for i in range(1200))])
+
+    chunks = list(rag_core.iter_chunks(str(path), chunk_tokens=100, overlap_tokens=10))
+
+    for (prev_offset, prev_length, _), (offset, _, _) in zip(chunks, chunks[1:]):
+        assert offset < prev_offset + prev_length
+
+
+def test_fallback_embedding_requests_stay_bounded(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    # An older server without /api/embed forces the single-text fallback
+    class NotFound:
+        is_success = False
+
+    monkeypatch.setattr(rag_core.client._client, "post", lambda *args, **kwargs: NotFound())
+
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def fake_embed(text):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.001)
+        with lock:
+            in_flight -= 1
+        return [1.0, float(len(text))]
+
+    monkeypatch.setattr(rag_core, "_embed_text", fake_embed)
+    monkeypatch.setattr(rag_core, "EMBED_BATCH_SIZE", 4)
+    monkeypatch.setattr(rag_core, "CACHE_DIR", tmp_path / "cache")
+    path = write_doc(tmp_path, [f"paragraph {i} " * 30 for i in range(200)])
+
+    embeddings, chunk_meta = rag_core.embed_documents({"DOC": str(path)}, rag_core.EmbeddingsCache())
+
+    assert embeddings.shape == (len(chunk_meta), 2)
+    assert peak <= rag_core.EMBED_WORKERS
+
+
+def stub_batch_embedder(monkeypatch):
+    """Replace the embedder with one that records every text it is asked to embed"""
+    embedded = []
+
+    def fake_batch(texts, parallel=True):
+        embedded.extend(texts)
+        return rag_core._normalize(rag_core.np.array([[1.0, float(len(text))] for text in texts], dtype=rag_core.np.float32))
+
+    monkeypatch.setattr(rag_core, "get_embeddings_batch", fake_batch)
+    return embedded
+
+
+def test_embeddings_cache_reused_across_document_sets(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_core, "CACHE_DIR", tmp_path / "cache")
+    embedded = stub_batch_embedder(monkeypatch)
+    doc_a = tmp_path / "a.md"
+    doc_a.write_text("content of a\n")
+    doc_b = tmp_path / "b.md"
+    doc_b.write_text("content of b\n")
+
+    # Run A, then B, then A again, loading the cache fresh each time like main() does
+    for name, path in [("A", doc_a), ("B", doc_b), ("A", doc_a)]:
+        rag_core.embed_documents({name: str(path)}, rag_core.load_embeddings_cache())
+
+    assert embedded == ["content of a\n", "content of b\n"]
+    assert len(rag_core.load_embeddings_cache()) == 2
+
+    monkeypatch.setattr(rag_core, "EMBED_MODEL", "other-model:latest")
+    assert len(rag_core.load_embeddings_cache()) == 0
+
+
+def test_embeddings_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_core, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(rag_core, "CACHE_MAX_ENTRIES", 2)
+    stub_batch_embedder(monkeypatch)
+    docs = {}
+    for name in ["a", "b", "c"]:
+        docs[name] = tmp_path / f"{name}.md"
+        docs[name].write_text(f"content of {name}\n")
+
+    for name in ["a", "b", "a", "c"]:
+        rag_core.embed_documents({name: str(docs[name])}, rag_core.load_embeddings_cache())
+
+    # b was used least recently, so it is the one dropped
+    cache = rag_core.load_embeddings_cache()
+    assert rag_core.chunk_hash("content of a\n") in cache
+    assert rag_core.chunk_hash("content of b\n") not in cache
+    assert rag_core.chunk_hash("content of c\n") in cache
+    assert len(list((tmp_path / "cache").glob("*.npy"))) == 1
+
+
+def test_inconsistent_embeddings_cache_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_core, "CACHE_DIR", tmp_path / "cache")
+    stub_batch_embedder(monkeypatch)
+    doc = write_doc(tmp_path, ["some content"])
+    rag_core.embed_documents({"DOC": str(doc)}, rag_core.load_embeddings_cache())
+
+    # Simulate a key list that no longer matches its matrix
+    index_path = rag_core._cache_index_path()
+    index = rag_core.json.loads(index_path.read_text())
+    index["keys"].append("extra")
+    index["last_used"].append(0.0)
+    index_path.write_text(rag_core.json.dumps(index))
+
+    assert len(rag_core.load_embeddings_cache()) == 0
+
+
+def test_empty_documents_give_empty_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_core, "CACHE_DIR", tmp_path / "cache")
+    path = tmp_path / "blank.md"
+    path.write_text("\n   \n\n")
+
+    embeddings, chunk_meta = rag_core.embed_documents({"BLANK": str(path)}, rag_core.EmbeddingsCache())
+    index = rag_core.build_index(embeddings)
+
+    assert chunk_meta == []
+    assert index is None
+    assert rag_core.find_relevant_context("anything", {"BLANK": str(path)}, index, chunk_meta) == ""
+
+
+def clustered_embeddings(n, dim, seed=0):
+    """Correlated unit vectors: a shared base direction plus noise, like real embeddings"""
+    np = rag_core.np
+    rng = np.random.default_rng(seed)
+    base = rng.standard_normal(dim)
+    return rag_core._normalize((base + 0.5 * rng.standard_normal((n, dim))).astype(np.float32))
+
+
+def test_flat_index_matches_exact_cosine_ranking():
+    np = rag_core.np
+    embeddings = clustered_embeddings(200, 64)
+
+    index = rag_core.build_index(embeddings)
+    _, top = index.search(embeddings, 3)
+
+    assert isinstance(index, rag_core.faiss.IndexFlatIP)
+    assert (top == np.argsort(-(embeddings @ embeddings.T), axis=1)[:, :3]).all()
+
+
+def test_quantized_hnsw_index_approximates_cosine_ranking(monkeypatch):
+    np = rag_core.np
+    monkeypatch.setattr(rag_core, "HNSW_MIN_CHUNKS", 100)
+    # Queries come from the same cluster as the chunks
+    vectors = clustered_embeddings(600, 64)
+    embeddings, queries = vectors[:500], vectors[500:]
+
+    index = rag_core.build_index(embeddings)
+    _, top = index.search(queries, 3)
+    exact = np.argsort(-(queries @ embeddings.T), axis=1)[:, :3]
+
+    # Tolerance: SQ8 codes and HNSW are both approximate, so require the exact
+    # best chunk in the top 3 for at least 95% of queries and at least 90%
+    # recall of the exact top-3 overall
+    best_found = np.mean([exact[i, 0] in top[i] for i in range(len(queries))])
+    recall = np.mean([len(set(top[i]) & set(exact[i])) / 3 for i in range(len(queries))])
+    assert isinstance(index, rag_core.faiss.IndexHNSWSQ)
+    assert best_found >= 0.95
+    assert recall >= 0.9
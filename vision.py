@@ -1,11 +1,18 @@
+import base64
 import ollama
+from pathlib import Path
 
-for chunk in ollama.chat(
+client = ollama.Client(timeout=600)
+
+# Encode the image once rather than on every request
+img_b64 = base64.b64encode(Path('img/beyond.png').read_bytes()).decode()
+
+for chunk in client.chat(
     model='llama3.2-vision:90b',
     messages=[{
         'role': 'user',
         'content': 'provide an analysis of content of the image',
-        'images': ['img/beyond.png']
+        'images': [img_b64]
     }],
     stream=True
 ):